@@ -3,13 +3,17 @@
 Funtions to process model predictions into outputs for model evaluation and
 mapping crowns in geographic space.
 """
+import concurrent.futures
+import functools
 import glob
 import json
+import logging
+import mmap
+import multiprocessing
 import os
 import re
-from http.client import REQUEST_URI_TOO_LONG  # noqa: F401
 from pathlib import Path
-from typing import Any, Dict, List, TypedDict
+from typing import Any, Dict, Iterator, List, Optional, TypedDict
 
 import cv2
 import geopandas as gpd
@@ -22,6 +26,13 @@ from shapely.affinity import scale
 from shapely.geometry import Polygon, box, shape
 from shapely.ops import orient
 
+try:
+    import orjson
+except ImportError:  # optional speed-up, stdlib json is the fallback
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
 # Type aliases definitions
 Feature = Dict[str, Any]
 CRSType = TypedDict("CRSType", {"type": str, "properties": Dict[str, str]})
@@ -57,6 +68,27 @@ def polygon_from_mask(masked_arr):
         return 0
 
 
+def _contour_from_mask(masked_arr):
+    """Extract the first valid contour of a mask as an (n, 2) integer array, or None.
+
+    Array-returning fast path of polygon_from_mask for the per-crown hot loop: cv2.findContours already runs
+    in compiled code, so the win is skipping the flatten/tolist/re-array round trip per crown.
+    """
+    contours, _ = cv2.findContours(
+        masked_arr, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+
+    for contour in contours:
+        # Valid polygons have >= 6 coordinates (3 points) -  for security we use 10
+        if contour.size >= 10:
+            contour = contour.reshape(-1, 2)
+            # Ensure the polygon is closed
+            if (contour[0] != contour[-1]).any():
+                contour = np.concatenate([contour, contour[:1]])
+            return contour
+
+    return None
+
+
 def to_eval_geojson(directory=None):  # noqa:N803
     """Converts predicted jsons to a geojson for evaluation (not mapping!).
 
@@ -148,100 +180,292 @@ def to_eval_geojson(directory=None):  # noqa:N803
                 json.dump(geofile, dest)
 
 
-def project_to_geojson(tiles_path, pred_fold=None, output_fold=None, multi_class: bool = False):  # noqa:N803
+@functools.lru_cache(maxsize=256)
+def _transform_matrix(raster_transform) -> np.ndarray:
+    """Return the pixel-centre 3x3 matrix of an affine transform.
+
+    Cached because grid-regular tilings produce many tiles sharing a transform, so the matrix is built once
+    per distinct transform rather than once per tile.
+    """
+    t = raster_transform
+    matrix = np.array([[t.a, t.b, t.c], [t.d, t.e, t.f], [0, 0, 1]])
+    return matrix @ np.array([[1, 0, 0.5], [0, 1, 0.5], [0, 0, 1]])
+
+
+def _crown_properties_single(score, category) -> Dict[str, Any]:
+    """Build the properties dict of a single-class crown feature."""
+    return {"Confidence_score": score}
+
+
+def _crown_properties_multi(score, category) -> Dict[str, Any]:
+    """Build the properties dict of a multi-class crown feature."""
+    return {"Confidence_score": score, "category": category}
+
+
+def process_crowns(datajson, raster_transform, multi_class: bool = False,
+                   confidence: float = 0) -> Iterator[Feature]:
+    """Convert the predicted crowns of a single tile into GeoJSON features.
+
+    Args:
+        datajson (list): Predicted crowns loaded from a prediction json file.
+        raster_transform: Affine transform of the tile the predictions belong to.
+        multi_class (bool): Whether to record the predicted category of each crown.
+        confidence (float): Minimum confidence score for a crown to be projected. Crowns below the threshold
+            are skipped before the expensive mask decode and contouring.
+
+    Yields:
+        dict: A GeoJSON feature dictionary per valid crown, so callers can stream features to disk without
+        holding the whole tile's output in memory.
+    """
+    # Affine transform as a 3x3 matrix, shifted by half a pixel so vertices map to pixel centres. Applying it
+    # with a single matmul replaces rasterio.transform.xy, which loops in Python over every vertex.
+    transform_center = _transform_matrix(raster_transform)
+
+    # First pass: decode the masks and gather every crown's pixel coordinates so the affine transform can be
+    # applied to the whole tile in one matmul rather than once per crown.
+    crown_properties = []
+    crown_arrays = []
+    counts = []
+
+    # multi_class is constant across the tile, so pick the properties builder once rather than branching on
+    # it for every crown
+    make_properties = _crown_properties_multi if multi_class else _crown_properties_single
+
+    # Keep only the fields used here - score, segmentation and (for multi-class) category - so the rest of
+    # each prediction dict (image_id, bbox and other metadata) can be freed while the features stream out
+    scores = [crown_data["score"] for crown_data in datajson]
+    segmentations = [crown_data["segmentation"] for crown_data in datajson]
+    if multi_class:
+        categories = [crown_data["category_id"] for crown_data in datajson]
+    else:
+        categories = [None] * len(scores)
+    datajson = None
+
+    # Vectorise the confidence filter over the whole tile so the Python loop only touches surviving crowns
+    if confidence > 0:
+        kept = np.nonzero(np.fromiter(scores, np.float64, len(scores)) >= confidence)[0]
+    else:
+        kept = range(len(scores))
+
+    # json file is formated as a list of segmentation polygons so cycle through each one
+    for i in kept:
+        crown = segmentations[i]
+
+        # changing the coords from RLE format so can be read as numbers, here the numbers are
+        # integers so a bit of info on position is lost
+        bbox_x, bbox_y, bbox_w, bbox_h = (int(value) for value in mask_util.toBbox(crown))
+        if bbox_w == 0 or bbox_h == 0:
+            continue
+
+        # Contour only the crown's bounding box: the RLE decode is C-level and cheap but cv2.findContours on
+        # a full tile-sized mask is not, and most crowns cover a small fraction of the tile.
+        mask_of_coords = mask_util.decode(crown)
+        cropped_mask = np.ascontiguousarray(mask_of_coords[bbox_y:bbox_y + bbox_h, bbox_x:bbox_x + bbox_w])
+        crown_coords_array = _contour_from_mask(cropped_mask)
+        if crown_coords_array is None:
+            continue
+
+        crown_coords_array[:, 0] += bbox_x
+        crown_coords_array[:, 1] += bbox_y
+        crown_arrays.append(crown_coords_array)
+        counts.append(crown_coords_array.shape[0])
+        crown_properties.append(make_properties(scores[i], categories[i]))
+
+    if not crown_arrays:
+        return
+
+    all_coords = np.concatenate(crown_arrays)
+    pixel_coords = np.ones((3, all_coords.shape[0]))
+    pixel_coords[0] = all_coords[:, 0]
+    pixel_coords[1] = all_coords[:, 1]
+    xy = transform_center @ pixel_coords
+
+    # Split the transformed coordinates back out per crown. orjson serialises the (n, 2) arrays natively, so
+    # the per-crown tolist conversion is only needed on the stdlib json fallback. The transpose must be
+    # materialised as C-contiguous first: orjson rejects the non-contiguous views np.split would yield.
+    offsets = np.cumsum(counts)
+    coords = np.ascontiguousarray(xy[:2].T)
+    for properties, moved_coords in zip(crown_properties, np.split(coords, offsets[:-1])):
+        yield {
+            "type": "Feature",
+            "properties": properties,
+            "geometry": {
+                "type": "Polygon",
+                "coordinates": [moved_coords if orjson is not None else moved_coords.tolist()],
+            },
+        }
+
+
+_gdal_env = None
+
+
+def _ensure_gdal_env():
+    """Enter a process-wide rasterio.Env on first use.
+
+    Every rasterio.open outside an Env sets up and tears down the GDAL environment (driver lookup, config
+    parsing). Keeping one Env open per worker process pays that cost once rather than per tile.
+    """
+    global _gdal_env
+    if _gdal_env is None:
+        _gdal_env = rasterio.Env()
+        _gdal_env.__enter__()
+
+
+@functools.lru_cache(maxsize=256)
+def _open_tile(tifpath: str):
+    """Return the affine transform and EPSG code of a tile.
+
+    Cached so predictions sharing a tile do not reopen the dataset (GDAL driver init plus disk I/O). Only the
+    transform and EPSG are kept, not the open dataset, to avoid leaking file descriptors.
+    """
+    _ensure_gdal_env()
+    with rasterio.open(tifpath) as data:
+        epsg = CRS.from_string(data.crs.wkt).to_epsg()
+        return data.transform, epsg
+
+
+@functools.lru_cache(maxsize=32)
+def _geofile_header(epsg: int) -> bytes:
+    """Return the opening of a FeatureCollection for an EPSG code, up to the features array."""
+    crs = {"type": "name", "properties": {"name": "urn:ogc:def:crs:EPSG::" + str(epsg)}}
+    return b'{"type": "FeatureCollection", "crs": ' + _dumps(crs) + b', "features": ['
+
+
+def _loads(data):
+    """Parse json bytes, with orjson when available (3-10x faster than stdlib)."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# Below this size the cost of setting up a mapping outweighs a plain read
+_MMAP_THRESHOLD = 4096
+
+
+def _read_json(path):
+    """Load a prediction json file, memory-mapping it when large enough to benefit.
+
+    mmap lets the kernel page the data in with readahead rather than copying the whole file through a read
+    buffer, which helps when many workers read concurrently. Tiny files are read directly since the mapping
+    overhead dominates there.
+    """
+    with open(path, "rb") as source:
+        if os.fstat(source.fileno()).st_size < _MMAP_THRESHOLD:
+            return _loads(source.read())
+        with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            if hasattr(mmap, "MADV_SEQUENTIAL"):
+                buffer.madvise(mmap.MADV_SEQUENTIAL)
+            view = memoryview(buffer)
+            try:
+                # stdlib json does not accept buffer objects, so the fallback has to copy
+                return _loads(view if orjson is not None else bytes(view))
+            finally:
+                view.release()
+
+
+def _dumps(obj) -> bytes:
+    """Serialise an object to json bytes, with orjson when available.
+
+    With orjson, NumPy arrays are serialised natively so callers can skip converting coordinate arrays to
+    lists first.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj).encode()
+
+
+def project_files(filename, tiles_path, output_fold, multi_class: bool = False, confidence: float = 0):
+    """Project a single json prediction file back into geographic space.
+
+    Args:
+        filename (Path): Path to the prediction json file.
+        tiles_path (str): Path to the tiles folder.
+        output_fold (str): Path to the output folder.
+        multi_class (bool): Whether to record the predicted category of each crown.
+        confidence (float): Minimum confidence score for a crown to be projected.
+
+    Returns:
+        None
+    """
+    # Derive the per-file paths once, from the stem, rather than chaining Path constructions
+    stem = filename.stem
+    tifpath = os.path.join(tiles_path, stem.replace("Prediction_", "") + ".tif")
+    output_geo_file = os.path.join(output_fold, stem + ".geojson")
+
+    raster_transform, epsg = _open_tile(tifpath)
+
+    # load the json file we need to convert into a geojson
+    datajson = _read_json(filename)
+
+    # Stream the features straight to disk so peak memory stays at one feature rather than the whole tile
+    with open(output_geo_file, "wb") as dest:
+        dest.write(_geofile_header(epsg))
+        for idx, feature in enumerate(process_crowns(datajson, raster_transform, multi_class, confidence)):
+            if idx:
+                dest.write(b",")
+            dest.write(_dumps(feature))
+        dest.write(b"]}")
+
+
+def project_to_geojson(tiles_path,
+                       pred_fold=None,
+                       output_fold=None,
+                       multi_class: bool = False,
+                       confidence: float = 0,
+                       max_workers: Optional[int] = None):  # noqa:N803
     """Projects json predictions back in geographic space.
 
     Takes a json and changes it to a geojson so it can overlay with orthomosaic. Another copy is produced to overlay
-    with PNGs.
+    with PNGs. The per-file work is CPU bound (mask decoding, contour extraction and coordinate transforms) so files
+    are fanned out across a pool of worker processes.
 
     Args:
         tiles_path (str): Path to the tiles folder.
         pred_fold (str): Path to the predictions folder.
         output_fold (str): Path to the output folder.
+        multi_class (bool): Whether to record the predicted category of each crown.
+        confidence (float): Minimum confidence score for a crown to be projected. Defaults to 0 (keep all).
+        max_workers (int): Number of workers to project files in parallel. Defaults to the number of CPUs.
 
     Returns:
         None
     """
     Path(output_fold).mkdir(parents=True, exist_ok=True)
-    entries = list(Path(pred_fold) / file for file in os.listdir(pred_fold) if Path(file).suffix == ".json")
+    # scandir avoids the second stat syscall of listdir and the throwaway Path built per file for the
+    # suffix check
+    with os.scandir(pred_fold) as scan:
+        entries = [Path(entry.path) for entry in scan if entry.name.endswith(".json")]
     total_files = len(entries)
-    print(f"Projecting {total_files} files")
-
-    for idx, filename in enumerate(entries, start=1):
-        if idx % 50 == 0:
-            print(f"Projecting file {idx} of {total_files}: {filename}")
-
-        tifpath = Path(tiles_path) / Path(filename.name.replace("Prediction_", "")).with_suffix(".tif")
-
-        data = rasterio.open(tifpath)
-        epsg = CRS.from_string(data.crs.wkt)
-        epsg = epsg.to_epsg()
-        raster_transform = data.transform
-
-        geofile = {
-            "type": "FeatureCollection",
-            "crs": {
-                "type": "name",
-                "properties": {
-                    "name": "urn:ogc:def:crs:EPSG::" + str(epsg)
-                },
-            },
-            "features": [],
-        }  # type: GeoFile
-
-        # load the json file we need to convert into a geojson
-        with open(filename, "r") as prediction_file:
-            datajson = json.load(prediction_file)
-
-        # json file is formated as a list of segmentation polygons so cycle through each one
-        for crown_data in datajson:
-            if multi_class:
-                category = crown_data["category_id"]
-                # print(category)
-            crown = crown_data["segmentation"]
-            confidence_score = crown_data["score"]
-
-            # changing the coords from RLE format so can be read as numbers, here the numbers are
-            # integers so a bit of info on position is lost
-            mask_of_coords = mask_util.decode(crown)
-            crown_coords = polygon_from_mask(mask_of_coords)
-            if crown_coords == 0:
-                continue
-
-            crown_coords_array = np.array(crown_coords).reshape(-1, 2)
-            x_coords, y_coords = rasterio.transform.xy(transform=raster_transform,
-                                                       rows=crown_coords_array[:, 1],
-                                                       cols=crown_coords_array[:, 0])
-            moved_coords = list(zip(x_coords, y_coords))
-            if multi_class:
-                geofile["features"].append({
-                    "type": "Feature",
-                    "properties": {
-                        "Confidence_score": confidence_score,
-                        "category": category,
-                    },
-                    "geometry": {
-                        "type": "Polygon",
-                        "coordinates": [moved_coords],
-                    },
-                })
-            else:
-                geofile["features"].append({
-                    "type": "Feature",
-                    "properties": {
-                        "Confidence_score": confidence_score
-                    },
-                    "geometry": {
-                        "type": "Polygon",
-                        "coordinates": [moved_coords],
-                    },
-                })
-                # print(geofile["features"])
-
-        output_geo_file = os.path.join(output_fold, filename.with_suffix(".geojson").name)
-
-        with open(output_geo_file, "w") as dest:
-            json.dump(geofile, dest)
+    logger.info("Projecting %s files", total_files)
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    if max_workers == 1:
+        for idx, filename in enumerate(entries, start=1):
+            if idx % 50 == 0:
+                logger.info("Projecting file %s of %s: %s", idx, total_files, filename)
+            project_files(filename, tiles_path, output_fold, multi_class, confidence)
+        return
+
+    # Processes sidestep the GIL so the decode/contour/transform work parallelises properly. Fall back to
+    # threads where fork is unavailable.
+    if "fork" in multiprocessing.get_all_start_methods():
+        executor_class = concurrent.futures.ProcessPoolExecutor
+    else:
+        executor_class = concurrent.futures.ThreadPoolExecutor
+
+    worker = functools.partial(project_files,
+                               tiles_path=tiles_path,
+                               output_fold=output_fold,
+                               multi_class=multi_class,
+                               confidence=confidence)
+    # Small chunks keep the inter-process overhead down while letting the pool balance files of uneven size
+    chunksize = max(1, total_files // (4 * max_workers))
+    with executor_class(max_workers=max_workers) as pool:
+        for idx, _ in enumerate(pool.map(worker, entries, chunksize=chunksize), start=1):
+            if idx % 50 == 0:
+                logger.info("Projected file %s of %s", idx, total_files)
 
 
 def filename_geoinfo(filename):
@@ -0,0 +1,73 @@
+import json
+
+import numpy as np
+import pycocotools.mask as mask_util
+import rasterio
+from rasterio.transform import from_origin
+
+from detectree2.models.outputs import project_files
+
+
+def test_project_files_round_trip(tmp_path):
+    """Round-trip one prediction file through project_files.
+
+    Covers the primary projection path end-to-end, including the orjson fast path when orjson is installed:
+    the coordinate arrays handed to the serialiser must be C-contiguous or orjson rejects them.
+    """
+    tiles_path = tmp_path / "tiles"
+    pred_fold = tmp_path / "predictions"
+    output_fold = tmp_path / "output"
+    for folder in (tiles_path, pred_fold, output_fold):
+        folder.mkdir()
+
+    # A 16x16 tile with one crown in the middle
+    stem = "tile_0_0_16_0_32622"
+    with rasterio.open(
+            tiles_path / (stem + ".tif"),
+            "w",
+            driver="GTiff",
+            height=16,
+            width=16,
+            count=1,
+            dtype="uint8",
+            crs="EPSG:32622",
+            transform=from_origin(0, 16, 1, 1),
+    ) as dataset:
+        dataset.write(np.zeros((1, 16, 16), dtype="uint8"))
+
+    # An L-shaped crown: a plain square compresses to 4 contour points under CHAIN_APPROX_SIMPLE, which the
+    # >= 5 vertex guard in the contour extraction rejects
+    mask = np.zeros((16, 16), dtype=np.uint8)
+    mask[4:12, 4:12] = 1
+    mask[4:8, 4:8] = 0
+    rle = mask_util.encode(np.asfortranarray(mask))
+    prediction = [{
+        "image_id": stem,
+        "category_id": 1,
+        "score": 0.9,
+        "segmentation": {
+            "size": list(rle["size"]),
+            "counts": rle["counts"].decode("utf-8"),
+        },
+    }]
+    prediction_file = pred_fold / ("Prediction_" + stem + ".json")
+    prediction_file.write_text(json.dumps(prediction))
+
+    project_files(prediction_file, str(tiles_path), str(output_fold))
+
+    with open(output_fold / ("Prediction_" + stem + ".geojson")) as dest:
+        geofile = json.load(dest)
+
+    assert geofile["type"] == "FeatureCollection"
+    assert geofile["crs"]["properties"]["name"] == "urn:ogc:def:crs:EPSG::32622"
+    assert len(geofile["features"]) == 1
+
+    feature = geofile["features"][0]
+    assert feature["properties"]["Confidence_score"] == 0.9
+
+    ring = feature["geometry"]["coordinates"][0]
+    assert ring[0] == ring[-1]  # polygon is closed
+    # The crown sits inside the tile extent
+    for x, y in ring:
+        assert 0 <= x <= 16
+        assert 0 <= y <= 16